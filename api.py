@@ -1,15 +1,24 @@
+import asyncio
+import json
+import logging
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, model_validator
 from typing import List, Dict, Any, Optional
 from contextual_response import ContextualResponseGenerator
 from bot_service import handle_query_response, HELP_CHANNEL_ID
+from logging_config import setup_logging
+
+setup_logging()
+logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
 app = FastAPI(
     title="RAG Chat API",
     description="API for retrieving context-aware responses using RAG",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -24,6 +33,11 @@ app.add_middleware(
 # Initialize the response generator
 response_generator = ContextualResponseGenerator()
 
+@app.on_event("shutdown")
+def save_cache():
+    """Persist the semantic cache index on shutdown."""
+    response_generator.save_cache()
+
 class QueryRequest(BaseModel):
     """Request model for query endpoint."""
     query: str = Field(..., description="The user's question")
@@ -32,6 +46,13 @@ class QueryRequest(BaseModel):
     send_to_chat: Optional[bool] = Field(False, description="Whether to send the response to chat")
     channel_id: Optional[str] = Field(HELP_CHANNEL_ID, description="The channel ID to send the response to")
 
+    @model_validator(mode='after')
+    def _check_channel(self):
+        """Reject chat delivery outside the help channel at parse time."""
+        if self.send_to_chat and self.channel_id != HELP_CHANNEL_ID:
+            raise ValueError("Bot responses are only available in the help channel")
+        return self
+
 @app.post("/query")
 async def query(request: QueryRequest):
     """
@@ -49,37 +70,77 @@ async def query(request: QueryRequest):
         dict: The response containing the answer and context
     """
     try:
-        print(f"Processing query: {request.query}")
+        logger.info(f"Processing query: {request.query}")
         
-        # If sending to chat, validate channel
-        if request.send_to_chat and request.channel_id != HELP_CHANNEL_ID:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Bot responses are only available in the help channel"
-            )
-            
-        response = response_generator.generate_response(
-            query=request.query,
-            max_context=request.max_context,
-            use_cache=request.use_cache
+        # Run the blocking search + LLM call off the event loop
+        response = await asyncio.to_thread(
+            response_generator.generate_response,
+            request.query,
+            request.max_context,
+            request.use_cache
         )
         
         # If requested, send the response to chat
         if request.send_to_chat:
             try:
-                print(f"Sending response to chat in channel: {request.channel_id}")
-                handle_query_response(request.query, response['answer'], channel_id=request.channel_id)
+                logger.info(f"Sending response to chat in channel: {request.channel_id}")
+                await handle_query_response(request.query, response['answer'], channel_id=request.channel_id)
             except Exception as e:
-                print(f"Warning: Failed to send message to chat: {e}")
+                logger.warning(f"Failed to send message to chat: {e}")
                 # Continue with the API response even if chat message fails
         
         return response
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"Error processing query: {e}")
+        logger.error(f"Error processing query: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/query/stream")
+async def query_stream(request: QueryRequest):
+    """
+    Stream a contextual response for a query as server-sent events.
+    
+    Each answer chunk is sent as a JSON-encoded `data:` event, followed by a
+    final `done` event. Errors raised mid-stream are sent as an `error` event.
+    
+    Args:
+        request (QueryRequest): The query request (see /query)
+    
+    Returns:
+        StreamingResponse: An SSE stream of answer chunks
+    """
+    logger.info(f"Streaming query: {request.query}")
+    
+    async def event_stream():
+        chunks = []
+        try:
+            async for chunk in response_generator.stream_response(
+                query=request.query,
+                max_context=request.max_context,
+                use_cache=request.use_cache
+            ):
+                chunks.append(chunk)
+                yield f"data: {json.dumps(chunk)}\n\n"
+        except Exception as e:
+            logger.error(f"Error streaming query: {e}")
+            yield f"event: error\ndata: {json.dumps(str(e))}\n\n"
+            return
+        
+        # If requested, send the full response to chat
+        if request.send_to_chat:
+            try:
+                logger.info(f"Sending response to chat in channel: {request.channel_id}")
+                await handle_query_response(request.query, "".join(chunks), channel_id=request.channel_id)
+            except Exception as e:
+                logger.warning(f"Failed to send message to chat: {e}")
+        
+        yield "event: done\ndata: {}\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+# For multiple workers, run under gunicorn with the app preloaded:
+#   gunicorn -c gunicorn.conf.py api:app
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
@@ -1,88 +1,134 @@
 import os
-import time
+import signal
+import logging
+import threading
 import firebase_admin
-from firebase_admin import credentials, firestore
-from datetime import datetime
+from firebase_admin import credentials, firestore, firestore_async
+from datetime import datetime, timezone
+from pathlib import Path
+from logging_config import setup_logging
+
+setup_logging()
+logger = logging.getLogger(__name__)
 
 # Initialize Firebase Admin with service account
 cred = credentials.Certificate('credentials/firebase-credentials.json')
 firebase_admin.initialize_app(cred)
 db = firestore.client()
+async_db = firestore_async.client()
 
 # Constants
 HELP_CHANNEL_ID = 'help'
 BOT_USER_ID = os.getenv('BOT_USER_ID')
+LAST_SYNC_PATH = Path(os.getenv('BOT_LAST_SYNC_PATH', '.bot_last_sync'))
+
+# Help channel message collection, resolved once for the async writer
+HELP_MESSAGES_REF = async_db.collection('messages').document(HELP_CHANNEL_ID).collection('messages')
+
+# Creation time of the newest help channel message seen by the watcher
+last_sync = None
 
 def is_help_channel(channel_id):
     """Check if the given channel is the help channel."""
     return channel_id == HELP_CHANNEL_ID
 
-def send_bot_message(content, channel_id=HELP_CHANNEL_ID):
+async def send_bot_message(content, channel_id=HELP_CHANNEL_ID):
     """Send a message as the bot."""
     try:
         # Only allow messages in help channel
         if not is_help_channel(channel_id):
-            print(f"Ignoring message for non-help channel: {channel_id}")
+            logger.info(f"Ignoring message for non-help channel: {channel_id}")
             return False
             
-        print(f"Sending bot message: {content}")
-        messages_ref = db.collection('messages').document(channel_id).collection('messages')
-        messages_ref.add({
+        logger.info(f"Sending bot message: {content}")
+        await HELP_MESSAGES_REF.add({
             'content': content,
             'userId': BOT_USER_ID,
             'userName': 'RAG Assistant',
             'createdAt': firestore.SERVER_TIMESTAMP,
             'isBot': True
         })
-        print("Successfully sent bot message")
+        logger.info("Successfully sent bot message")
         return True
     except Exception as e:
-        print(f"Error sending bot message: {e}")
+        logger.error(f"Error sending bot message: {e}")
         raise e
 
-def handle_query_response(query, response, channel_id=HELP_CHANNEL_ID):
+async def handle_query_response(query, response, channel_id=HELP_CHANNEL_ID):
     """Handle a query response by sending messages."""
     try:
         # Only process messages in help channel
         if not is_help_channel(channel_id):
-            print(f"Ignoring query response for non-help channel: {channel_id}")
+            logger.info(f"Ignoring query response for non-help channel: {channel_id}")
             return
             
-        print(f"Handling query response for: {query}")
+        logger.info(f"Handling query response for: {query}")
         
-        # Send typing indicator
-        send_bot_message("_Thinking..._", channel_id)
-        time.sleep(1)  # Brief pause to show typing indicator
+        # Send typing indicator; the client orders it before the response via onSnapshot
+        await send_bot_message("_Thinking..._", channel_id)
         
         # Send the actual response
-        send_bot_message(response, channel_id)
-        print("Response sent successfully")
+        await send_bot_message(response, channel_id)
+        logger.info("Response sent successfully")
                 
     except Exception as e:
-        print(f"Error handling query response: {e}")
+        logger.error(f"Error handling query response: {e}")
         if is_help_channel(channel_id):
-            send_bot_message("Sorry, I encountered an error processing your request. Please try again later.", channel_id)
+            await send_bot_message("Sorry, I encountered an error processing your request. Please try again later.", channel_id)
+
+def read_last_sync():
+    """Read the last synced message time, defaulting to now on first run."""
+    try:
+        return datetime.fromisoformat(LAST_SYNC_PATH.read_text().strip())
+    except (FileNotFoundError, ValueError):
+        return datetime.now(timezone.utc)
+
+def write_last_sync(timestamp):
+    """Persist the last synced message time."""
+    LAST_SYNC_PATH.write_text(timestamp.isoformat())
+
+def on_snapshot(doc_snapshot, changes, read_time):
+    """Track newly added help channel messages and advance the last sync time."""
+    global last_sync
+    latest = last_sync
+    for change in changes:
+        if change.type.name != 'ADDED':
+            continue
+        message = change.document.to_dict()
+        created_at = message.get('createdAt')
+        if created_at and created_at > latest:
+            latest = created_at
+        if message.get('isBot'):
+            continue
+        logger.info(f"New help message from {message.get('userName', 'Unknown User')}: {message.get('content', '')}")
+    
+    if latest > last_sync:
+        last_sync = latest
+        write_last_sync(last_sync)
 
 def main():
     """Main bot service function."""
-    print("Starting bot service...")
+    global last_sync
+    logger.info("Starting bot service...")
     
     # Create a reference to the help channel messages
     help_messages_ref = db.collection('messages').document(HELP_CHANNEL_ID).collection('messages')
     
-    # Create query for new messages
-    query = help_messages_ref.where('createdAt', '>=', datetime.now())
+    # Only fetch messages added since the last sync, so restarts don't replay history
+    last_sync = read_last_sync()
+    query = help_messages_ref.where('createdAt', '>', last_sync).order_by('createdAt')
     
     # Watch the query
     watch = query.on_snapshot(on_snapshot)
     
-    try:
-        # Keep the main thread alive
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        print("\nShutting down bot service...")
-        watch.unsubscribe()
+    # Park the main thread until interrupted
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    stop.wait()
+    
+    logger.info("Shutting down bot service...")
+    watch.unsubscribe()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,4 +1,5 @@
 import os
+import asyncio
 from pinecone import Pinecone
 from dotenv import load_dotenv
 
@@ -12,7 +13,8 @@ if not PINECONE_API_KEY:
     print("Error: PINECONE_API_KEY not found in environment variables")
     exit(1)
 
-try:
+async def main():
+    """List all Pinecone indexes, fetching each index's details concurrently."""
     # Initialize Pinecone with new syntax
     pc = Pinecone(api_key=PINECONE_API_KEY)
     
@@ -23,16 +25,24 @@ try:
     
     if not indexes:
         print("No indexes found in your Pinecone account")
-    else:
-        for index in indexes:
-            # Get details for each index
-            print(f"\nIndex Name: {index.name}")
-            print(f"Host: {index.host}")
-            print(f"Status: {index.status}")
-            print(f"Dimension: {index.dimension}")
-            print(f"Metric: {index.metric}")
-            print("-" * 50)
+        return
+    
+    # Get details for each index concurrently (the SDK is blocking, so use threads)
+    details = await asyncio.gather(*[
+        asyncio.to_thread(pc.describe_index, index.name)
+        for index in indexes
+    ])
+    
+    for index in details:
+        print(f"\nIndex Name: {index.name}")
+        print(f"Host: {index.host}")
+        print(f"Status: {index.status}")
+        print(f"Dimension: {index.dimension}")
+        print(f"Metric: {index.metric}")
+        print("-" * 50)
 
+try:
+    asyncio.run(main())
 except Exception as e:
     print(f"Error checking Pinecone indexes: {str(e)}")
-    exit(1) 
\ No newline at end of file
+    exit(1)
@@ -1,66 +1,197 @@
 import os
-from typing import List, Dict, Any, Tuple
+import atexit
+import asyncio
+import hashlib
+import logging
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 from datetime import datetime
+from functools import cached_property
 
+import httpx
+import redis
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema import StrOutputParser
 
 from query import VectorDBQuery, QueryError
 from response_cache import ResponseCache
+from semantic_cache import SemanticCache, RedisSemanticCache
+
+logger = logging.getLogger(__name__)
+
+LLM_MODEL = "gpt-3.5-turbo"
+
+SYSTEM_PROMPT = """You are a helpful chat assistant that provides responses based on previous chat messages.
+            Use the provided message history as context to answer the user's question.
+            Keep your responses concise and focused on the relevant information from the context.
+            If the context doesn't contain relevant information, say so and provide a general response."""
+
+USER_PROMPT = """Context from previous messages:
+            {context}
+            
+            User Question: {query}
+            
+            Please provide a helpful response based on this context."""
+
+# Semantic cache entries are only valid for the prompt and model that produced them
+PROMPT_HASH = hashlib.sha256(f"{LLM_MODEL}\n{SYSTEM_PROMPT}\n{USER_PROMPT}".encode('utf-8')).hexdigest()
 
 class ContextualResponseGenerator:
-    def __init__(self, cache_dir: str = ".cache", cache_ttl: int = 24):
+    def __init__(self, cache_dir: str = ".cache", cache_ttl: int = 24, semantic_threshold: float = 0.95):
         """
         Initialize the contextual response generator.
         
         Args:
             cache_dir (str): Directory to store response cache
             cache_ttl (int): Cache time-to-live in hours
+            semantic_threshold (float): Minimum cosine similarity for a semantic cache hit
         """
+        self.cache_dir = cache_dir
+        self.cache_ttl = cache_ttl
+        self.semantic_threshold = semantic_threshold
         self._initialize_llm()
+        self._initialize_chain()
         self.query_system = VectorDBQuery()
-        self.cache = ResponseCache(cache_dir=cache_dir, ttl_hours=cache_ttl)
+
+    # Caches hold file handles and connections, so they are opened lazily in
+    # each worker process rather than inherited across a preload fork.
+    @cached_property
+    def cache(self) -> ResponseCache:
+        """Exact-match response cache."""
+        return ResponseCache(cache_dir=self.cache_dir, ttl_hours=self.cache_ttl)
+
+    @cached_property
+    def semantic_cache(self):
+        """Semantic cache, shared via Redis when REDIS_URL is set and reachable."""
+        redis_url = os.getenv("REDIS_URL")
+        if redis_url:
+            try:
+                return RedisSemanticCache(
+                    prompt_hash=PROMPT_HASH,
+                    redis_url=redis_url,
+                    ttl_hours=self.cache_ttl,
+                    threshold=self.semantic_threshold
+                )
+            except redis.RedisError as e:
+                # Answering without a shared cache beats failing the request
+                logger.warning(f"Redis semantic cache unavailable, using the local cache: {e}")
+        return SemanticCache(
+            prompt_hash=PROMPT_HASH,
+            cache_dir=self.cache_dir,
+            ttl_hours=self.cache_ttl,
+            threshold=self.semantic_threshold
+        )
 
     def _initialize_llm(self) -> None:
         """Initialize the LLM with appropriate settings."""
         try:
+            # Shared keep-alive HTTP/2 clients so requests reuse warm connections
+            limits = httpx.Limits(max_keepalive_connections=100, max_connections=200)
+            self._http = httpx.Client(http2=True, limits=limits)
+            self._ahttp = httpx.AsyncClient(http2=True, limits=limits)
+            atexit.register(self._close_http_clients)
+            
             self.llm = ChatOpenAI(
-                model="gpt-3.5-turbo",
+                model=LLM_MODEL,
                 temperature=0.7,
+                http_client=self._http,
+                http_async_client=self._ahttp,
             )
         except Exception as e:
             raise QueryError(f"Failed to initialize LLM: {str(e)}")
 
+    def _close_http_clients(self) -> None:
+        """Close the shared HTTP clients."""
+        self._http.close()
+        try:
+            asyncio.run(self._ahttp.aclose())
+        except Exception:
+            # The loop that owned the connections may be gone; the process is exiting anyway
+            pass
+
+    def _initialize_chain(self) -> None:
+        """Build the prompt template and LLM chain once for reuse across requests."""
+        self.prompt_template = ChatPromptTemplate.from_messages([
+            ("system", SYSTEM_PROMPT),
+            ("user", USER_PROMPT)
+        ])
+        self.chain = self.prompt_template | self.llm | StrOutputParser()
+
     def _format_context(self, results: List[Dict[str, Any]]) -> str:
         """Format search results into context string for the LLM."""
-        context_parts = []
+        return "\n".join(
+            f"{i}. {message['user_name']} in #{message['channel_id']} "
+            f"({message['timestamp']}): {message['content']}"
+            for i, result in enumerate(results, 1)
+            for message in (result['message'],)
+        )
+
+    def _retrieve(self, query: str, query_embedding: List[float], max_context: int,
+                  use_cache: bool) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]], Optional[str]]:
+        """
+        Run the cache lookups and vector search shared by every generation path.
         
-        for i, result in enumerate(results, 1):
-            message = result['message']
-            context_parts.append(
-                f"{i}. {message['user_name']} in #{message['channel_id']} "
-                f"({message['timestamp']}): {message['content']}"
-            )
+        Args:
+            query (str): The user's question
+            query_embedding (List[float]): Embedding of the question
+            max_context (int): Maximum number of context messages to include
+            use_cache (bool): Whether to use response caching
+            
+        Returns:
+            Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]], Optional[str]]:
+                - Cached response, or None if the LLM must be called
+                - Search results to use as context
+                - Exact-match cache key, or None if caching is disabled
+        """
+        # Check semantic cache for a near-duplicate query first if enabled
+        if use_cache:
+            cached_response, cache_stats = self.semantic_cache.get(query_embedding, max_context)
+            if cached_response:
+                return cached_response, [], None
+        
+        # Get relevant messages from vector store
+        search_results = self.query_system.query_messages_by_vector(query_embedding, top_k=max_context)
         
-        return "\n".join(context_parts)
+        # Check exact-match cache if enabled
+        cache_key = None
+        if use_cache:
+            cache_key = self.cache.make_key(query, search_results)
+            cached_response, cache_stats = self.cache.get(cache_key)
+            if cached_response:
+                return cached_response, search_results, cache_key
+        
+        return None, search_results, cache_key
 
-    def _create_prompt(self, query: str, context: str) -> str:
-        """Create the prompt template for the LLM."""
-        template = ChatPromptTemplate.from_messages([
-            ("system", """You are a helpful chat assistant that provides responses based on previous chat messages.
-            Use the provided message history as context to answer the user's question.
-            Keep your responses concise and focused on the relevant information from the context.
-            If the context doesn't contain relevant information, say so and provide a general response."""),
-            ("user", """Context from previous messages:
-            {context}
-            
-            User Question: {query}
+    def _store(self, query: str, query_embedding: List[float], answer: str, max_context: int,
+               search_results: List[Dict[str, Any]], cache_key: Optional[str]) -> Dict[str, Any]:
+        """
+        Build the response object and cache it when caching is enabled.
+        
+        Args:
+            query (str): The user's question
+            query_embedding (List[float]): Embedding of the question
+            answer (str): The generated answer
+            max_context (int): Maximum number of context messages requested
+            search_results (List[Dict[str, Any]]): Context the answer was based on
+            cache_key (Optional[str]): Exact-match cache key from _retrieve
             
-            Please provide a helpful response based on this context.""")
-        ])
+        Returns:
+            Dict[str, Any]: Response object containing the answer and context
+        """
+        response_obj = {
+            "answer": answer,
+            "context": search_results,
+            "timestamp": datetime.now().isoformat(),
+            "query": query,
+            "cached": False
+        }
         
-        return template
+        # Cache the response if enabled
+        if cache_key is not None:
+            self.cache.set(cache_key, response_obj)
+            self.semantic_cache.set(query, query_embedding, response_obj, max_context)
+        
+        return response_obj
 
     def generate_response(self, query: str, max_context: int = 5, use_cache: bool = True) -> Dict[str, Any]:
         """
@@ -75,42 +206,108 @@ class ContextualResponseGenerator:
             Dict[str, Any]: Response object containing the answer and context
         """
         try:
-            # Get relevant messages from vector store
-            search_results = self.query_system.query_messages(query, top_k=max_context)
+            # Embed once; the vector serves both the semantic cache and the search
+            query_embedding = self.query_system.embed(query)
             
-            # Check cache first if enabled
-            if use_cache:
-                cached_response, cache_stats = self.cache.get(query, search_results)
-                if cached_response:
-                    return cached_response
+            cached_response, search_results, cache_key = self._retrieve(
+                query, query_embedding, max_context, use_cache
+            )
+            if cached_response:
+                return cached_response
             
-            # Format context for LLM
-            context = self._format_context(search_results)
+            # Generate response using LLM
+            response = self.chain.invoke({
+                "context": self._format_context(search_results),
+                "query": query
+            })
+            
+            return self._store(query, query_embedding, response, max_context, search_results, cache_key)
+            
+        except QueryError:
+            raise
+        except Exception as e:
+            raise QueryError(f"Error generating response: {str(e)}")
+
+    async def generate_response_async(self, query: str, max_context: int = 5, use_cache: bool = True) -> Dict[str, Any]:
+        """
+        Asynchronously generate a contextual response using vector search and LLM.
+        
+        Args:
+            query (str): The user's question
+            max_context (int): Maximum number of context messages to include
+            use_cache (bool): Whether to use response caching
             
-            # Create and format prompt
-            prompt = self._create_prompt(query, context)
+        Returns:
+            Dict[str, Any]: Response object containing the answer and context
+        """
+        try:
+            # Embed once; the vector serves both the semantic cache and the search
+            query_embedding = await self.query_system.aembed(query)
+            
+            # Cache lookups (SQLite, faiss/Redis, lazy cache construction) and the
+            # search all block, so they run in a worker thread
+            cached_response, search_results, cache_key = await asyncio.to_thread(
+                self._retrieve, query, query_embedding, max_context, use_cache
+            )
+            if cached_response:
+                return cached_response
             
             # Generate response using LLM
-            chain = prompt | self.llm | StrOutputParser()
-            response = chain.invoke({
-                "context": context,
+            response = await self.chain.ainvoke({
+                "context": self._format_context(search_results),
                 "query": query
             })
             
-            # Create response object
-            response_obj = {
-                "answer": response,
-                "context": search_results,
-                "timestamp": datetime.now().isoformat(),
-                "query": query,
-                "cached": False
-            }
+            return await asyncio.to_thread(
+                self._store, query, query_embedding, response, max_context, search_results, cache_key
+            )
+            
+        except QueryError:
+            raise
+        except Exception as e:
+            raise QueryError(f"Error generating response: {str(e)}")
+
+    async def stream_response(self, query: str, max_context: int = 5, use_cache: bool = True) -> AsyncIterator[str]:
+        """
+        Stream a contextual response token by token.
+        
+        The full answer is accumulated and cached once the stream completes.
+        A cache hit yields the cached answer as a single chunk.
+        
+        Args:
+            query (str): The user's question
+            max_context (int): Maximum number of context messages to include
+            use_cache (bool): Whether to use response caching
             
-            # Cache the response if enabled
-            if use_cache:
-                self.cache.set(query, search_results, response_obj)
+        Yields:
+            str: Chunks of the generated answer
+        """
+        try:
+            # Embed once; the vector serves both the semantic cache and the search
+            query_embedding = await self.query_system.aembed(query)
             
-            return response_obj
+            # Cache lookups (SQLite, faiss/Redis, lazy cache construction) and the
+            # search all block, so they run in a worker thread
+            cached_response, search_results, cache_key = await asyncio.to_thread(
+                self._retrieve, query, query_embedding, max_context, use_cache
+            )
+            if cached_response:
+                yield cached_response["answer"]
+                return
+            
+            # Stream response from LLM
+            chunks = []
+            async for chunk in self.chain.astream({
+                "context": self._format_context(search_results),
+                "query": query
+            }):
+                chunks.append(chunk)
+                yield chunk
+            
+            # Cache the full response if enabled
+            await asyncio.to_thread(
+                self._store, query, query_embedding, "".join(chunks), max_context, search_results, cache_key
+            )
             
         except QueryError:
             raise
@@ -128,6 +325,11 @@ class ContextualResponseGenerator:
         """
         return self.cache.clear_expired()
 
+    def save_cache(self) -> None:
+        """Persist the semantic cache index to disk, if it was opened."""
+        if "semantic_cache" in self.__dict__:
+            self.semantic_cache.save()
+
     def get_cache_stats(self) -> Dict[str, Any]:
         """
         Get current cache statistics.
@@ -49,8 +49,9 @@ def create_bot_account():
             'updatedAt': firestore.SERVER_TIMESTAMP
         }
         
-        db.collection('users').document(user.uid).set(bot_doc, merge=True)
-        print("Updated bot user document in Firestore")
+        # Queue all setup writes in a single batch
+        batch = db.batch()
+        batch.set(db.collection('users').document(user.uid), bot_doc, merge=True)
         
         # Create help channel if it doesn't exist
         help_channel_ref = db.collection('channels').document('help')
@@ -63,8 +64,7 @@ def create_bot_account():
             'isPublic': True
         }
         
-        help_channel_ref.set(help_channel, merge=True)
-        print("Created/Updated help channel")
+        batch.set(help_channel_ref, help_channel, merge=True)
         
         # Add bot as member of help channel
         help_channel_members_ref = db.collection('channelMembers').document('help').collection('members').document(user.uid)
@@ -73,7 +73,11 @@ def create_bot_account():
             'role': 'bot',
             'joinedAt': firestore.SERVER_TIMESTAMP
         }
-        help_channel_members_ref.set(member_doc)
+        batch.set(help_channel_members_ref, member_doc)
+        
+        batch.commit()
+        print("Updated bot user document in Firestore")
+        print("Created/Updated help channel")
         print("Added bot as help channel member")
         
         # Save bot credentials securely
@@ -3,7 +3,6 @@ import firebase_admin
 from firebase_admin import credentials, firestore
 from datetime import datetime, timedelta
 import random
-import time
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -34,6 +33,9 @@ except Exception as e:
     print("3. Or set FIREBASE_CREDENTIALS_PATH in your .env file")
     exit(1)
 
+# Maximum writes per Firestore batch commit
+BATCH_SIZE = 500
+
 # Sample data for generating messages
 USERS = [
     {"id": "user1", "name": "Alice Johnson"},
@@ -95,17 +97,35 @@ def create_messages(num_messages=50):
     """Create test messages across channels."""
     print(f"Generating {num_messages} test messages...")
     
+    batch = db.batch()
+    pending = 0
+    
     for _ in range(num_messages):
         channel = random.choice(CHANNELS)
         message = generate_message()
         
-        try:
-            # Add message to the channel's messages subcollection
-            db.collection('messages').document(channel['id']).collection('messages').add(message)
-            print(f"Added message to {channel['name']}: {message['content'][:30]}...")
-            time.sleep(0.1)  # Small delay to avoid overwhelming Firestore
-        except Exception as e:
-            print(f"Error adding message: {str(e)}")
+        # Queue message in the channel's messages subcollection
+        doc_ref = db.collection('messages').document(channel['id']).collection('messages').document()
+        batch.set(doc_ref, message)
+        pending += 1
+        print(f"Queued message for {channel['name']}: {message['content'][:30]}...")
+        
+        if pending >= BATCH_SIZE:
+            commit_batch(batch, pending)
+            batch = db.batch()
+            pending = 0
+    
+    # Commit remaining messages
+    if pending:
+        commit_batch(batch, pending)
+
+def commit_batch(batch, count):
+    """Commit a write batch of messages."""
+    try:
+        batch.commit()
+        print(f"Committed batch of {count} messages")
+    except Exception as e:
+        print(f"Error committing batch of {count} messages: {str(e)}")
 
 def main():
     """Main function to generate test data."""
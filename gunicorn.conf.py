@@ -0,0 +1,20 @@
+# gunicorn -c gunicorn.conf.py api:app
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Import the app (and build the response generator) once in the master;
+# workers share those pages copy-on-write and open their own connections lazily
+preload_app = True
+
+# Each worker saves its semantic cache on shutdown, one at a time under a file
+# lock; a merging save rebuilds the HNSW index (~7 s at 10k entries), so allow
+# every worker a full save before the master kills it
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", str(max(30, 15 * workers))))
+
+def post_fork(server, worker):
+    """Start this worker's log listener; the master's thread did not survive the fork."""
+    from logging_config import setup_logging
+    setup_logging()
@@ -1,17 +1,20 @@
 import os
+import json
+import sqlite3
+import hashlib
 import firebase_admin
 from firebase_admin import credentials, firestore
 from langchain_openai import OpenAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
+from pinecone import Pinecone
+from tenacity import retry, stop_after_attempt, wait_exponential
+from ratelimit import limits, sleep_and_retry
 from datetime import datetime, timezone
 import time
 from pathlib import Path
 from dotenv import load_dotenv
-import gc
-from time import time, sleep
-
-# Initialize last_call_time for rate limiting
-last_call_time = time()
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 
 # Load environment variables with explicit path
 # base_path = Path(__file__).parent  # Gets the directory containing this script
@@ -58,18 +61,42 @@ if not all([PINECONE_API_KEY, OPENAI_API_KEY, index_name]):
     print("- PINECONE_INDEX")
     exit(1)
 
+# Messages read per Firestore page
+PAGE_SIZE = 500
+
+# Collection group partitions read in parallel on a full run
+PARTITION_COUNT = 32
+
+# Per-channel createdAt (epoch seconds) of the newest indexed message
+INDEXING_STATE_PATH = Path(os.getenv('INDEXING_STATE_PATH', 'indexing_state.json'))
+
+# Content hashes of indexed messages, used to skip unchanged ones
+EMBED_CACHE_PATH = os.getenv('EMBED_CACHE_PATH', 'embed_cache.db')
+
+# Messages embedded per OpenAI request, and vectors per Pinecone upsert request
+EMBED_BATCH_SIZE = 512
+UPSERT_BATCH_SIZE = 100
+
+# Channels or partitions ingested in parallel, and Pinecone upsert threads per worker
+CHANNEL_WORKERS = 8
+UPSERT_POOL_THREADS = 8
+UPSERT_TIMEOUT = 60
+
+# Provider request budgets, shared across all worker threads
+OPENAI_EMBED_CALLS_PER_MINUTE = 3000
+PINECONE_UPSERTS_PER_SECOND = 100
+
 # Initialize embeddings
 embeddings = OpenAIEmbeddings()
 
-# Initialize Pinecone vector store
+# Initialize Pinecone client
 try:
-    vectorstore = PineconeVectorStore.from_existing_index(
-        index_name=index_name,
-        embedding=embeddings,
-        text_key="content"
-    )
-    # Test connection with a simple operation
-    vectorstore.similarity_search("test", k=1)
+    pinecone_client = Pinecone(api_key=PINECONE_API_KEY)
+    # One handle for the whole process; async_req upserts from every worker thread
+    # share its thread pool, which the SDK keeps alive until exit
+    pinecone_index = pinecone_client.Index(index_name, pool_threads=CHANNEL_WORKERS * UPSERT_POOL_THREADS)
+    # Validate credentials and index existence without an embedding call
+    pinecone_index.describe_index_stats()
     print("Vector store connection verified")
 except Exception as e:
     print(f"Error connecting to vector store: {str(e)}")
@@ -80,19 +107,88 @@ def get_all_channels():
     channels = db.collection('channels').stream()
     return [channel.id for channel in channels]
 
+def get_message_partitions(partition_count=PARTITION_COUNT):
+    """Split the 'messages' collection group into cursor ranges that can be read in parallel."""
+    return list(db.collection_group('messages').get_partitions(partition_count))
+
 def get_messages_for_channel(channel_id, last_indexed_time=None):
-    """Fetch messages for a specific channel, optionally after a certain time."""
+    """
+    Fetch messages for a specific channel in createdAt order, optionally after a certain time.
+    
+    Messages are read in bounded pages of PAGE_SIZE using cursors rather than
+    one long-lived stream.
+    """
     messages_ref = db.collection('messages').document(channel_id).collection('messages')
     query = messages_ref
     
     if last_indexed_time:
         query = query.where('createdAt', '>', last_indexed_time)
     
-    messages = query.stream()
-    return messages
+    query = query.order_by('createdAt').limit(PAGE_SIZE)
+    page = list(query.stream())
+    while page:
+        yield from page
+        if len(page) < PAGE_SIZE:
+            break
+        page = list(query.start_after(page[-1]).stream())
+
+def load_indexing_state():
+    """Load the per-channel high-water marks of previous runs."""
+    try:
+        with INDEXING_STATE_PATH.open('r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def update_indexing_state(channel_id, timestamp):
+    """Record the createdAt of the newest indexed message of a channel."""
+    with _indexing_state_lock:
+        indexing_state[channel_id] = max(timestamp, indexing_state.get(channel_id, 0))
+        # Write a temp file and rename it into place so a crash never leaves
+        # a truncated state file, which would silently force a full re-read
+        tmp_path = INDEXING_STATE_PATH.with_suffix('.tmp')
+        with tmp_path.open('w') as f:
+            json.dump(indexing_state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, INDEXING_STATE_PATH)
+
+def get_embed_cache():
+    """Open the content-hash cache of indexed messages."""
+    conn = sqlite3.connect(EMBED_CACHE_PATH, check_same_thread=False)
+    conn.execute("CREATE TABLE IF NOT EXISTS cache (id TEXT PRIMARY KEY, content_sha BLOB)")
+    conn.commit()
+    return conn
+
+def is_unchanged(vector_id, content_sha):
+    """Check whether a message was already indexed with the same content."""
+    with _embed_cache_lock:
+        row = embed_cache.execute("SELECT content_sha FROM cache WHERE id = ?", (vector_id,)).fetchone()
+    return row is not None and row[0] == content_sha
+
+def record_indexed(batch):
+    """Store the content hashes of a successfully upserted batch."""
+    with _embed_cache_lock, embed_cache:
+        embed_cache.executemany(
+            "INSERT OR REPLACE INTO cache (id, content_sha) VALUES (?, ?)",
+            [(doc['id'], doc['content_sha']) for doc in batch]
+        )
 
-def create_message_vector(message_doc):
-    """Create a vector from a message document."""
+def created_at_to_ts(created_at):
+    """Convert a Firestore createdAt value to a POSIX timestamp."""
+    # Datetimes (including Firestore's DatetimeWithNanoseconds) convert themselves
+    to_timestamp = getattr(created_at, 'timestamp', None)
+    if to_timestamp is not None:
+        return to_timestamp()
+    # Raw protobuf Timestamp
+    return created_at.seconds + (created_at.nanos / 1e9)
+
+def create_message_vector(message_doc, channel_id, now_ts=None):
+    """
+    Create a vector from a message document, or None if it is empty or unchanged.
+    
+    now_ts is used for messages without createdAt; callers compute it once per batch.
+    """
     message_data = message_doc.to_dict()
     
     # Create the text content to be embedded
@@ -105,21 +201,23 @@ def create_message_vector(message_doc):
     # Handle timestamp conversion
     created_at = message_data.get('createdAt')
     if created_at:
-        if isinstance(created_at, datetime):
-            timestamp = created_at.timestamp()
-        else:
-            # Handle Firestore timestamp
-            timestamp = created_at.seconds + (created_at.nanos / 1e9)
+        timestamp = created_at_to_ts(created_at)
     else:
-        timestamp = datetime.now(timezone.utc).timestamp()
+        timestamp = now_ts if now_ts is not None else time.time()
     
     # Combine message content with metadata for context
     text_to_embed = f"User {user_name} wrote: {content}"
     
+    # Skip messages already indexed with identical text
+    vector_id = f"{channel_id}_{message_doc.id}"
+    content_sha = hashlib.sha256(text_to_embed.encode('utf-8')).digest()
+    if is_unchanged(vector_id, content_sha):
+        return None
+    
     # Prepare metadata
     metadata = {
         'message_id': message_doc.id,
-        'channel_id': message_doc.reference.parent.parent.id,
+        'channel_id': channel_id,
         'user_id': message_data.get('userId', ''),
         'user_name': user_name,
         'timestamp': timestamp,
@@ -127,82 +225,204 @@ def create_message_vector(message_doc):
     }
     
     return {
-        'id': f"{message_doc.reference.parent.parent.id}_{message_doc.id}",
+        'id': vector_id,
         'text': text_to_embed,
+        'content_sha': content_sha,
         'metadata': metadata
     }
 
-def rate_limit(calls_per_second=10):
-    """Implement adaptive rate limiting"""
-    global last_call_time
-    current_time = time()
-    time_since_last_call = current_time - last_call_time
-    time_per_call = 1.0 / calls_per_second
-    
-    if time_since_last_call < time_per_call:
-        sleep_time = time_per_call - time_since_last_call
-        sleep(sleep_time)
-    
-    last_call_time = time()
+# Content-hash cache shared by the channel workers
+embed_cache = get_embed_cache()
+_embed_cache_lock = threading.Lock()
 
-def index_messages():
-    """Main function to index messages."""
-    print("Starting message indexing...")
+# High-water marks shared by the channel workers
+indexing_state = {}
+_indexing_state_lock = threading.Lock()
+
+@retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=1, max=30), reraise=True)
+@sleep_and_retry
+@limits(calls=OPENAI_EMBED_CALLS_PER_MINUTE, period=60)
+def embed_texts(texts):
+    """Embed a batch of texts in a single OpenAI request."""
+    return embeddings.embed_documents(texts)
+
+@sleep_and_retry
+@limits(calls=PINECONE_UPSERTS_PER_SECOND, period=1)
+def send_upsert(pinecone_index, chunk):
+    """Send one asynchronous upsert request to Pinecone."""
+    return pinecone_index.upsert(vectors=chunk, async_req=True)
+
+@retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=1, max=30), reraise=True)
+def upsert_vectors(vectors):
+    """Upsert (id, values, metadata) tuples into Pinecone with concurrent requests."""
+    vectors = iter(vectors)
+    results = [
+        send_upsert(pinecone_index, chunk)
+        for chunk in iter(lambda: list(islice(vectors, UPSERT_BATCH_SIZE)), [])
+    ]
+    # Wait for every request; any failure raises and retries the whole batch
+    for result in results:
+        result.get(timeout=UPSERT_TIMEOUT)
+
+def index_batch(batch):
+    """Embed and upsert a batch of message vectors."""
+    vectors = embed_texts([doc['text'] for doc in batch])
+    # Store the embedded text as the vector store's text key, as add_texts did
+    upsert_vectors([
+        (doc['id'], vector, {**doc['metadata'], 'content': doc['text']})
+        for doc, vector in zip(batch, vectors)
+    ])
+    record_indexed(batch)
+
+def ingest_channel(channel_id):
+    """Index all messages of one channel and return the number indexed."""
     messages_processed = 0
+    batch = []
+    # Once a message fails, the mark stays before it so the next run retries it
+    # (messages indexed after it are skipped then by the content-hash cache)
+    failed = False
     try:
-        # Get all channels
-        channels = get_all_channels()
-        print(f"Found {len(channels)} channels")
+        # Only index messages created since the last run
+        last_indexed_time = datetime.fromtimestamp(indexing_state.get(channel_id, 0), tz=timezone.utc)
+        messages = get_messages_for_channel(channel_id, last_indexed_time=last_indexed_time)
+        for message in messages:
+            if not batch:
+                now_ts = time.time()  # One clock read per batch
+            try:
+                vector_data = create_message_vector(message, channel_id, now_ts=now_ts)
+            except Exception as e:
+                print(f"Error processing message {message.id}: {str(e)}")
+                failed = True
+                continue
+            if vector_data:  # Only append if not None
+                batch.append(vector_data)
+            
+            # A failed batch ends the channel without advancing its mark, so the
+            # next run retries it instead of this one re-embedding an ever larger batch
+            if len(batch) >= EMBED_BATCH_SIZE:
+                index_batch(batch)
+                if not failed:
+                    update_indexing_state(channel_id, batch[-1]['metadata']['timestamp'])
+                print(f"Indexed batch of {len(batch)} messages from {channel_id}")
+                messages_processed += len(batch)
+                batch.clear()
+        
+        # Process remaining batch
+        if batch:
+            index_batch(batch)
+            if not failed:
+                update_indexing_state(channel_id, batch[-1]['metadata']['timestamp'])
+            print(f"Indexed final batch of {len(batch)} messages from {channel_id}")
+            messages_processed += len(batch)
         
-        for channel_id in channels:
-            batch = []
+    except Exception as e:
+        print(f"Error processing channel {channel_id}: {str(e)}")
+    
+    return messages_processed
+
+def ingest_partition(partition):
+    """
+    Index all messages in one collection group partition.
+    
+    Returns:
+        tuple: (number indexed, {channel_id: newest indexed createdAt},
+            channel ids with a message that failed, whether it completed)
+    """
+    messages_processed = 0
+    marks = {}
+    failed_channels = set()
+    batch = []
+    
+    def flush():
+        index_batch(batch)
+        for doc in batch:
+            channel_id = doc['metadata']['channel_id']
+            marks[channel_id] = max(doc['metadata']['timestamp'], marks.get(channel_id, 0))
+    
+    try:
+        for message in partition.query().stream():
+            # Top-level 'messages' documents are channel containers, not messages
+            channel_ref = message.reference.parent.parent
+            if channel_ref is None:
+                continue
+            if not batch:
+                now_ts = time.time()  # One clock read per batch
             try:
-                messages = get_messages_for_channel(channel_id)
-                for message in messages:
-                    try:
-                        # Rate limit message processing
-                        rate_limit(calls_per_second=10)
-                        
-                        vector_data = create_message_vector(message)
-                        if vector_data:  # Only append if not None
-                            batch.append(vector_data)
-                        
-                        if len(batch) >= 100:
-                            # Rate limit vector store updates
-                            rate_limit(calls_per_second=2)  # More conservative rate for Pinecone
-                            
-                            vectorstore.add_texts(
-                                texts=[doc['text'] for doc in batch],
-                                metadatas=[doc['metadata'] for doc in batch],
-                                ids=[doc['id'] for doc in batch]
-                            )
-                            print(f"Indexed batch of {len(batch)} messages")
-                            messages_processed += len(batch)
-                            if messages_processed % 1000 == 0:
-                                gc.collect()  # Force garbage collection periodically
-                            batch = []
-                    except Exception as e:
-                        print(f"Error processing message {message.id}: {str(e)}")
-                        continue
-                
-                # Process remaining batch
-                if batch:
-                    try:
-                        # Rate limit final batch
-                        rate_limit(calls_per_second=2)
-                        
-                        vectorstore.add_texts(
-                            texts=[doc['text'] for doc in batch],
-                            metadatas=[doc['metadata'] for doc in batch],
-                            ids=[doc['id'] for doc in batch]
-                        )
-                        print(f"Indexed final batch of {len(batch)} messages")
-                    except Exception as e:
-                        print(f"Error processing final batch: {str(e)}")
-                
+                vector_data = create_message_vector(message, channel_ref.id, now_ts=now_ts)
             except Exception as e:
-                print(f"Error processing channel {channel_id}: {str(e)}")
+                print(f"Error processing message {message.id}: {str(e)}")
+                failed_channels.add(channel_ref.id)
                 continue
+            if vector_data:  # Only append if not None
+                batch.append(vector_data)
+            
+            # A failed batch ends the partition as incomplete, so no marks are recorded
+            if len(batch) >= EMBED_BATCH_SIZE:
+                flush()
+                print(f"Indexed batch of {len(batch)} messages")
+                messages_processed += len(batch)
+                batch.clear()
+        
+        # Process remaining batch
+        if batch:
+            flush()
+            print(f"Indexed final batch of {len(batch)} messages")
+            messages_processed += len(batch)
+        
+    except Exception as e:
+        print(f"Error processing partition: {str(e)}")
+        return messages_processed, marks, failed_channels, False
+    
+    return messages_processed, marks, failed_channels, True
+
+def index_all_messages():
+    """Index every message by reading collection group partitions in parallel."""
+    run_started = time.time()
+    partitions = get_message_partitions()
+    print(f"Reading messages in {len(partitions)} partitions")
+    
+    with ThreadPoolExecutor(max_workers=CHANNEL_WORKERS) as executor:
+        results = list(executor.map(ingest_partition, partitions))
+    print(f"Indexed {sum(count for count, *_ in results)} messages")
+    
+    # Partitions are not time-ordered, so only record high-water marks once every
+    # partition succeeded; otherwise the next full run rescans (unchanged messages
+    # are skipped by the content-hash cache)
+    if not all(complete for *_, complete in results):
+        print("Some partitions failed; indexing state not updated")
+        return
+    # A channel with a failed message gets no mark at all, since newer messages of
+    # it may sit in any partition; the next run re-reads it from the start
+    failed_channels = set().union(*(failed for _, _, failed, _ in results))
+    for _, marks, _, _ in results:
+        for channel_id, timestamp in marks.items():
+            if channel_id in failed_channels:
+                continue
+            # Messages written during this run may sit in partitions already read
+            update_indexing_state(channel_id, min(timestamp, run_started))
+
+def index_new_messages():
+    """Index messages created since the last run, channel by channel."""
+    # Get all channels
+    channels = get_all_channels()
+    print(f"Found {len(channels)} channels")
+    
+    # Channels are independent, so overlap their Firestore reads and API calls
+    with ThreadPoolExecutor(max_workers=CHANNEL_WORKERS) as executor:
+        messages_processed = sum(executor.map(ingest_channel, channels))
+    print(f"Indexed {messages_processed} messages")
+
+def index_messages():
+    """Main function to index messages."""
+    print("Starting message indexing...")
+    indexing_state.update(load_indexing_state())
+    try:
+        # Partition queries cannot filter on createdAt, so they are only used
+        # for the first full run; later runs query each channel incrementally
+        if indexing_state:
+            index_new_messages()
+        else:
+            index_all_messages()
                 
     except Exception as e:
         print(f"Error during indexing: {str(e)}")
@@ -0,0 +1,49 @@
+import os
+import sys
+import queue
+import atexit
+import logging
+import logging.handlers
+
+_listener = None
+_queue_handler = None
+_pid = None
+
+def _stop_listener() -> None:
+    """Flush and stop the listener owned by this process."""
+    if _listener is not None and _pid == os.getpid():
+        _listener.stop()
+
+atexit.register(_stop_listener)
+
+def setup_logging(level: int = logging.INFO) -> None:
+    """
+    Route root logging through a queue drained by a background listener thread.
+
+    Request handlers only enqueue records; the listener does the stream I/O.
+    Safe to call more than once. Threads do not survive fork(), so a forked
+    child (e.g. a worker of a preloaded gunicorn app) must call it again to
+    get its own queue and listener; calls in the same process are no-ops.
+    """
+    global _listener, _queue_handler, _pid
+    if _pid == os.getpid():
+        return
+
+    root = logging.getLogger()
+    if _queue_handler is not None:
+        # Inherited from the parent, whose listener thread is not running here
+        root.removeHandler(_queue_handler)
+
+    log_queue = queue.Queue(-1)
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(
+        logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    )
+
+    root.setLevel(level)
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    root.addHandler(_queue_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+    _pid = os.getpid()
@@ -1,15 +1,61 @@
 import os
+import asyncio
+import threading
 from pathlib import Path
+from collections import OrderedDict
 from datetime import datetime
+from functools import cached_property, partial
 from typing import List, Dict, Any, Optional
 
+import blake3
+import orjson
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from langchain.storage.encoder_backed import EncoderBackedStore
 from langchain_openai import OpenAIEmbeddings
 from langchain_pinecone import PineconeVectorStore
+from pinecone import Pinecone
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# Maximum number of query embeddings kept in memory
+EMBEDDING_LRU_SIZE = 256
+# On-disk cache of embeddings shared across processes and restarts
+EMBED_CACHE_DIR = ".embed_cache"
+
+def _embedding_key(namespace: str, text: str) -> str:
+    """Build a compact cache key for an embedded text."""
+    digest = blake3.blake3(text.encode('utf-8')).hexdigest(length=16)
+    # Shard by the first two hex chars so no directory grows past ~1/256 of the entries
+    return f"{namespace}/{digest[:2]}/{digest[2:]}"
+
+# Threads (and pooled keep-alive connections) per Pinecone index client
+PINECONE_POOL_THREADS = 16
+
+_pinecone_indexes: Dict[str, Any] = {}
+_pinecone_lock = threading.Lock()
+
+def get_pinecone_index(index_name: str) -> Any:
+    """
+    Return the process-wide client for a Pinecone index, creating it on first use.
+
+    Sharing one client keeps its connection pool warm, so later queries
+    skip the TCP and TLS handshakes.
+
+    Args:
+        index_name (str): Name of the Pinecone index
+
+    Returns:
+        Any: Pinecone index client
+    """
+    with _pinecone_lock:
+        if index_name not in _pinecone_indexes:
+            client = Pinecone(api_key=os.getenv("PINECONE_API_KEY"), pool_threads=PINECONE_POOL_THREADS)
+            _pinecone_indexes[index_name] = client.Index(index_name)
+        return _pinecone_indexes[index_name]
+
 class QueryError(Exception):
     """Custom exception for query-related errors."""
     pass
@@ -19,7 +65,8 @@ class VectorDBQuery:
         """Initialize the vector database query system."""
         self.index_name = "rag-chat-messages-1536"
         self._initialize_credentials()
-        self._initialize_vector_store()
+        self._embedding_lru = OrderedDict()
+        self._embedding_lock = threading.Lock()
 
     def _initialize_credentials(self) -> None:
         """Initialize and validate required credentials."""
@@ -29,18 +76,49 @@ class VectorDBQuery:
         if not all([self.pinecone_api_key, self.openai_api_key]):
             raise QueryError("Missing required API keys. Please set PINECONE_API_KEY and OPENAI_API_KEY.")
 
-    def _initialize_vector_store(self) -> None:
-        """Initialize connection to Pinecone vector store."""
+    # Clients are created on first use so that each forked worker opens its own
+    # connections instead of inheriting sockets from a preloaded parent.
+    @cached_property
+    def embeddings(self) -> CacheBackedEmbeddings:
+        """OpenAI embeddings model backed by an on-disk cache."""
+        underlying = OpenAIEmbeddings()
+        # Namespaced by model so vectors from different models never mix
+        store = EncoderBackedStore(
+            LocalFileStore(EMBED_CACHE_DIR),
+            partial(_embedding_key, underlying.model),
+            orjson.dumps,
+            orjson.loads
+        )
+        return CacheBackedEmbeddings(underlying, store, query_embedding_store=store)
+
+    @cached_property
+    def vectorstore(self) -> PineconeVectorStore:
+        """Connection to Pinecone vector store."""
         try:
-            embeddings = OpenAIEmbeddings()
-            self.vectorstore = PineconeVectorStore.from_existing_index(
-                index_name=self.index_name,
-                embedding=embeddings,
+            return PineconeVectorStore(
+                index=get_pinecone_index(self.index_name),
+                embedding=self.embeddings,
                 text_key="content"
             )
         except Exception as e:
             raise QueryError(f"Failed to initialize vector store: {str(e)}")
 
+    def _cached_embedding(self, query: str) -> Optional[List[float]]:
+        """Return a query's in-memory embedding if present."""
+        with self._embedding_lock:
+            embedding = self._embedding_lru.get(query)
+            if embedding is not None:
+                self._embedding_lru.move_to_end(query)
+            return embedding
+
+    def _remember_embedding(self, query: str, embedding: List[float]) -> None:
+        """Store a query embedding, evicting the least recently used entry."""
+        with self._embedding_lock:
+            self._embedding_lru[query] = embedding
+            self._embedding_lru.move_to_end(query)
+            while len(self._embedding_lru) > EMBEDDING_LRU_SIZE:
+                self._embedding_lru.popitem(last=False)
+
     def _validate_query(self, query: str) -> None:
         """Validate the query string."""
         if not query or not isinstance(query, str):
@@ -82,28 +160,121 @@ class VectorDBQuery:
         Returns:
             List[Dict]: List of relevant messages with metadata and scores
         """
+        try:
+            # Embed through the in-memory cache, then search by vector
+            return self.query_messages_by_vector(self.embed(query), top_k=top_k)
+            
+        except QueryError:
+            raise
+        except Exception as e:
+            raise QueryError(f"Error performing search: {str(e)}")
+
+    async def aquery_messages(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Asynchronously search for messages similar to the query.
+        
+        Args:
+            query (str): The search query
+            top_k (int): Number of results to return (default: 5)
+            
+        Returns:
+            List[Dict]: List of relevant messages with metadata and scores
+        """
+        try:
+            # Embed through the in-memory cache, then search by vector
+            embedding = await self.aembed(query)
+            return await self.aquery_messages_by_vector(embedding, top_k=top_k)
+            
+        except QueryError:
+            raise
+        except Exception as e:
+            raise QueryError(f"Error performing search: {str(e)}")
+
+    def embed(self, query: str) -> List[float]:
+        """
+        Embed a query so it can be reused for several lookups.
+        
+        Args:
+            query (str): The search query
+            
+        Returns:
+            List[float]: The query embedding
+        """
         try:
             self._validate_query(query)
+            embedding = self._cached_embedding(query)
+            if embedding is None:
+                embedding = self.embeddings.embed_query(query)
+                self._remember_embedding(query, embedding)
+            return embedding
+        except QueryError:
+            raise
+        except Exception as e:
+            raise QueryError(f"Error embedding query: {str(e)}")
+
+    async def aembed(self, query: str) -> List[float]:
+        """
+        Asynchronously embed a query so it can be reused for several lookups.
+        
+        Args:
+            query (str): The search query
+            
+        Returns:
+            List[float]: The query embedding
+        """
+        try:
+            self._validate_query(query)
+            embedding = self._cached_embedding(query)
+            if embedding is None:
+                embedding = await self.embeddings.aembed_query(query)
+                self._remember_embedding(query, embedding)
+            return embedding
+        except QueryError:
+            raise
+        except Exception as e:
+            raise QueryError(f"Error embedding query: {str(e)}")
+
+    def query_messages_by_vector(self, embedding: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Search for messages similar to an already-embedded query.
+        
+        Args:
+            embedding (List[float]): The query embedding
+            top_k (int): Number of results to return (default: 5)
             
-            # Perform similarity search
-            results = self.vectorstore.similarity_search_with_score(
-                query=query,
+        Returns:
+            List[Dict]: List of relevant messages with metadata and scores
+        """
+        try:
+            results = self.vectorstore.similarity_search_by_vector_with_score(
+                embedding,
                 k=top_k
             )
             
-            # Format results
-            formatted_results = [
+            return [
                 self._format_result(doc, score)
                 for doc, score in results
             ]
             
-            return formatted_results
-            
         except QueryError:
             raise
         except Exception as e:
             raise QueryError(f"Error performing search: {str(e)}")
 
+    async def aquery_messages_by_vector(self, embedding: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Asynchronously search for messages similar to an already-embedded query.
+        
+        Args:
+            embedding (List[float]): The query embedding
+            top_k (int): Number of results to return (default: 5)
+            
+        Returns:
+            List[Dict]: List of relevant messages with metadata and scores
+        """
+        # The Pinecone vector store has no native async vector search
+        return await asyncio.to_thread(self.query_messages_by_vector, embedding, top_k)
+
 # Example usage
 if __name__ == "__main__":
     try:
@@ -1,14 +1,28 @@
-import json
-import hashlib
+import time
+import logging
+import sqlite3
+import threading
 from typing import Dict, Any, Optional, Tuple
-from datetime import datetime, timedelta
+from datetime import timedelta
 from pathlib import Path
 
+import blake3
+import orjson
+import zstandard as zstd
+
+logger = logging.getLogger(__name__)
+
+# Cached responses embed their full message context, which compresses well
+_COMPRESSOR = zstd.ZstdCompressor(level=3)
+_DECOMPRESSOR = zstd.ZstdDecompressor()
+
 class ResponseCache:
     def __init__(self, cache_dir: str = ".cache", ttl_hours: int = 24):
         """
         Initialize the response cache.
-        
+
+        Entries are stored in a single SQLite table keyed by cache key.
+
         Args:
             cache_dir (str): Directory to store cache files
             ttl_hours (int): Time-to-live in hours for cache entries
@@ -22,121 +36,140 @@ class ResponseCache:
             "errors": 0
         }
         self._ensure_cache_dir()
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.cache_dir / "cache.db"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, ts REAL, payload BLOB)"
+        )
+        self.conn.commit()
 
     def _ensure_cache_dir(self) -> None:
         """Create cache directory if it doesn't exist."""
         self.cache_dir.mkdir(parents=True, exist_ok=True)
 
+    def make_key(self, query: str, context: list) -> str:
+        """
+        Generate the cache key for a query and its context.
+
+        Compute it once per request and pass it to both get and set.
+
+        Args:
+            query (str): The original query
+            context (list): The context messages used
+
+        Returns:
+            str: Cache key
+        """
+        return self._generate_cache_key(query, self._context_hash(context))
+
     def _generate_cache_key(self, query: str, context_hash: str) -> str:
         """Generate a unique cache key from query and context."""
+        # Keys are only used for lookups; BLAKE3 is several times faster than SHA-256
         combined = f"{query}:{context_hash}".encode('utf-8')
-        return hashlib.sha256(combined).hexdigest()
-
-    def _get_cache_path(self, cache_key: str) -> Path:
-        """Get the file path for a cache key."""
-        return self.cache_dir / f"{cache_key}.json"
+        return blake3.blake3(combined).hexdigest(length=16)
 
     def _context_hash(self, context: list) -> str:
         """Generate a hash of the context messages."""
-        # Sort and stringify context to ensure consistent hashing
-        context_str = json.dumps(context, sort_keys=True)
-        return hashlib.sha256(context_str.encode('utf-8')).hexdigest()
+        # Results arrive in retrieval order and each message is identified by
+        # its id and timestamp, so hash just those instead of serializing content
+        hasher = blake3.blake3()
+        for result in context:
+            message = result.get("message", result)
+            hasher.update(str(message.get("message_id", "")).encode('utf-8'))
+            hasher.update(b"\x1f")
+            hasher.update(str(message.get("timestamp", "")).encode('utf-8'))
+            hasher.update(b"\x1e")
+        return hasher.hexdigest(length=16)
+
+    def _delete(self, cache_key: str) -> None:
+        """Remove a single cache entry."""
+        with self.conn:
+            self.conn.execute("DELETE FROM cache WHERE key = ?", (cache_key,))
 
-    def get(self, query: str, context: list) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+    def get(self, cache_key: str) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
         """
         Retrieve a cached response if available and not expired.
-        
+
         Args:
-            query (str): The original query
-            context (list): The context messages used
-            
+            cache_key (str): Key from make_key
+
         Returns:
-            Tuple[Optional[Dict[str, Any]], Dict[str, Any]]: 
+            Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
                 - Cached response or None if not found/expired
                 - Current cache statistics
         """
-        context_hash = self._context_hash(context)
-        cache_key = self._generate_cache_key(query, context_hash)
-        cache_path = self._get_cache_path(cache_key)
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT ts, payload FROM cache WHERE key = ?", (cache_key,)
+            ).fetchone()
 
-        if not cache_path.exists():
-            self.stats["misses"] += 1
-            return None, self.stats
+            if row is None:
+                self.stats["misses"] += 1
+                return None, self.stats
 
-        try:
-            with cache_path.open('r', encoding='utf-8') as f:
-                cached_data = json.load(f)
+            ts, payload = row
 
             # Check if cache has expired
-            cached_time = datetime.fromisoformat(cached_data['timestamp'])
-            if datetime.now() - cached_time > self.ttl:
-                cache_path.unlink()  # Remove expired cache
+            if time.time() - ts > self.ttl.total_seconds():
+                self._delete(cache_key)  # Remove expired cache
                 self.stats["expired"] += 1
                 return None, self.stats
 
+            try:
+                cached_data = orjson.loads(_DECOMPRESSOR.decompress(payload))
+            except (zstd.ZstdError, orjson.JSONDecodeError):
+                # Remove corrupted cache entry
+                self._delete(cache_key)
+                self.stats["errors"] += 1
+                return None, self.stats
+
             self.stats["hits"] += 1
             cached_data["cached"] = True  # Mark as cached
             return cached_data, self.stats
 
-        except (json.JSONDecodeError, KeyError, ValueError):
-            # Remove corrupted cache file
-            cache_path.unlink(missing_ok=True)
-            self.stats["errors"] += 1
-            return None, self.stats
-
-    def set(self, query: str, context: list, response: Dict[str, Any]) -> None:
+    def set(self, cache_key: str, response: Dict[str, Any]) -> None:
         """
         Store a response in the cache.
-        
+
         Args:
-            query (str): The original query
-            context (list): The context messages used
+            cache_key (str): Key from make_key
             response (Dict[str, Any]): The response to cache
         """
-        context_hash = self._context_hash(context)
-        cache_key = self._generate_cache_key(query, context_hash)
-        cache_path = self._get_cache_path(cache_key)
-
         try:
-            with cache_path.open('w', encoding='utf-8') as f:
-                json.dump(response, f, ensure_ascii=False, indent=2)
+            payload = _COMPRESSOR.compress(orjson.dumps(response))
+            with self._lock, self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, ts, payload) VALUES (?, ?, ?)",
+                    (cache_key, time.time(), payload)
+                )
         except Exception as e:
             self.stats["errors"] += 1
-            print(f"Warning: Failed to cache response: {str(e)}")
+            logger.warning(f"Failed to cache response: {e}")
 
     def clear_expired(self) -> Tuple[int, Dict[str, Any]]:
         """
         Clear expired cache entries.
-        
+
         Returns:
             Tuple[int, Dict[str, Any]]:
                 - Number of cache entries cleared
                 - Current cache statistics
         """
-        cleared_count = 0
-        for cache_file in self.cache_dir.glob("*.json"):
-            try:
-                with cache_file.open('r', encoding='utf-8') as f:
-                    cached_data = json.load(f)
-                
-                cached_time = datetime.fromisoformat(cached_data['timestamp'])
-                if datetime.now() - cached_time > self.ttl:
-                    cache_file.unlink()
-                    cleared_count += 1
-                    self.stats["expired"] += 1
-            except:
-                # Remove corrupted cache file
-                cache_file.unlink()
-                cleared_count += 1
-                self.stats["errors"] += 1
-        
+        with self._lock, self.conn:
+            cleared_count = self.conn.execute(
+                "DELETE FROM cache WHERE ts < ?", (time.time() - self.ttl.total_seconds(),)
+            ).rowcount
+        self.stats["expired"] += cleared_count
+
         return cleared_count, self.stats
 
     def get_stats(self) -> Dict[str, Any]:
         """
         Get current cache statistics.
-        
+
         Returns:
             Dict[str, Any]: Cache statistics
         """
-        return self.stats 
\ No newline at end of file
+        return self.stats
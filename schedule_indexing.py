@@ -1,5 +1,9 @@
-import schedule
-import time
+import signal
+import threading
+from datetime import datetime, timezone
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.triggers.cron import CronTrigger
 from index_messages import index_messages
 import logging
 
@@ -15,6 +19,9 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Persisted so a restart keeps the next run time instead of rescheduling a week out
+JOB_STORE_URL = 'sqlite:///jobs.db'
+
 def job():
     """Wrapper function for the indexing job with logging."""
     try:
@@ -26,18 +33,36 @@ def job():
 
 def main():
     """Main function to schedule and run the indexing job."""
-    # Schedule the job to run every Monday at 00:00
-    schedule.every().monday.at("00:00").do(job)
+    scheduler = BackgroundScheduler(jobstores={'default': SQLAlchemyJobStore(url=JOB_STORE_URL)})
+    # Paused so nothing fires (including a persisted misfired run) until the
+    # startup run below has been merged into the schedule
+    scheduler.start(paused=True)
     
-    logger.info("Scheduler started. Will run indexing every Monday at midnight.")
+    # Schedule the job to run every Monday at 00:00 unless a persisted schedule
+    # already exists; a run missed while stopped fires once on restart if within a day
+    if scheduler.get_job('weekly_index') is None:
+        scheduler.add_job(
+            job,
+            CronTrigger(day_of_week='mon', hour=0, minute=0),
+            id='weekly_index',
+            coalesce=True,
+            max_instances=1,
+            misfire_grace_time=24 * 60 * 60
+        )
     
-    # Run the job immediately once
-    job()
+    # Run the job immediately once, through the scheduler so it replaces any
+    # pending misfired run and can never overlap another run of the job
+    scheduler.modify_job('weekly_index', max_instances=1, next_run_time=datetime.now(timezone.utc))
+    scheduler.resume()
+    
+    logger.info("Scheduler started. Will run indexing every Monday at midnight.")
     
-    # Keep the script running
-    while True:
-        schedule.run_pending()
-        time.sleep(60)  # Check every minute instead of every second
+    # Block until interrupted instead of polling
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    stop.wait()
+    scheduler.shutdown()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,589 @@
+import os
+import json
+import uuid
+import fcntl
+import logging
+import struct
+import tempfile
+import threading
+from typing import Dict, Any, Optional, Tuple, List
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import faiss
+import numpy as np
+import redis
+from redis.commands.search.field import NumericField, TagField, VectorField
+from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+from redis.commands.search.query import Query
+
+logger = logging.getLogger(__name__)
+
+# Number of ANN candidates re-ranked with exact float32 similarity
+RECHECK_CANDIDATES = 4
+# HNSW search breadth; the default of 16 misses too many true neighbours
+HNSW_EF_SEARCH = 128
+# Entries needed before the quantizer is trained on real vectors instead of
+# fixed [-1, 1] bounds, and the most rows sampled to train it
+TRAIN_MIN_ROWS = 1000
+TRAIN_SAMPLE_ROWS = 4096
+# Entries kept by the local cache; the oldest are dropped beyond this
+MAX_ENTRIES = 10000
+# Fraction of MAX_ENTRIES kept when compacting a full cache, so rebuilds are rare
+COMPACT_RATIO = 0.9
+# Rows copied at a time when rebuilding or persisting vectors
+COPY_CHUNK_ROWS = 1024
+# Snapshot layout: magic, dim, entries length, index length, row count,
+# followed by the JSON entries, the serialized index and the float32 rows
+SNAPSHOT_MAGIC = b"SCv1"
+_SNAPSHOT_HEADER = struct.Struct('<4sIQQQ')
+# Bumped when the Redis schema changes so a stale index is never reused
+REDIS_SCHEMA_VERSION = 2
+# Seconds before an unreachable or stalled Redis counts as a cache error,
+# so a lookup never blocks a request for long
+REDIS_CONNECT_TIMEOUT = 2
+REDIS_SOCKET_TIMEOUT = 1
+
+class SemanticCache:
+    def __init__(
+        self,
+        prompt_hash: str,
+        cache_dir: str = ".cache",
+        ttl_hours: int = 24,
+        dim: int = 1536,
+        threshold: float = 0.95,
+        max_entries: int = MAX_ENTRIES
+    ):
+        """
+        Initialize the semantic (embedding-similarity) response cache.
+
+        Args:
+            prompt_hash (str): Hash of the prompt/model used to generate responses;
+                entries generated under a different prompt are never returned
+            cache_dir (str): Directory to persist the index and entries
+            ttl_hours (int): Time-to-live in hours for cache entries
+            dim (int): Embedding dimension
+            threshold (float): Minimum cosine similarity for a cache hit
+            max_entries (int): Maximum number of entries kept
+        """
+        self.prompt_hash = prompt_hash
+        self.cache_dir = Path(cache_dir)
+        self.ttl = timedelta(hours=ttl_hours)
+        self.dim = dim
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.snapshot_path = self.cache_dir / "semantic_cache.bin"
+        self.lock_path = self.cache_dir / "semantic_cache.lock"
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "errors": 0
+        }
+        self._lock = threading.Lock()
+        self._compacting = False
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    def _new_index(self, sample: Optional[np.ndarray] = None) -> faiss.Index:
+        """
+        Create an empty int8-quantized HNSW index over normalized vectors.
+
+        Inner product on normalized vectors is cosine similarity. Embedding
+        components use a small part of [-1, 1], so the per-dimension 8-bit
+        quantizer is trained on a sample of cached vectors when one is given,
+        and on the [-1, 1] bounds otherwise.
+
+        Args:
+            sample (Optional[np.ndarray]): Normalized vectors to train the quantizer on
+        """
+        index = faiss.IndexHNSWSQ(
+            self.dim, faiss.ScalarQuantizer.QT_8bit, 32, faiss.METRIC_INNER_PRODUCT
+        )
+        if sample is None:
+            sample = np.array([[-1.0] * self.dim, [1.0] * self.dim], dtype=np.float32)
+        index.train(sample)
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        return index
+
+    def _training_sample(self, read_row, count: int) -> Optional[np.ndarray]:
+        """
+        Read evenly spaced rows to train a quantizer on.
+
+        Args:
+            read_row: Callable returning the float32 vector of row i
+            count (int): Number of rows available
+
+        Returns:
+            Optional[np.ndarray]: The sample, or None if there are too few rows
+        """
+        if count < TRAIN_MIN_ROWS:
+            return None
+        step = max(1, count // TRAIN_SAMPLE_ROWS)
+        return np.stack([read_row(i) for i in range(0, count, step)])
+
+    def _new_vectors_file(self):
+        """
+        Open an anonymous file holding one float32 row per entry.
+
+        The exact vectors are only needed to re-rank a few candidates, so
+        they stay on disk (and in the page cache) instead of the heap.
+        """
+        return tempfile.TemporaryFile(dir=self.cache_dir, buffering=0)
+
+    def _append_vectors(self, vectors_file, vectors: np.ndarray) -> None:
+        """Append float32 rows to a vectors file."""
+        vectors_file.seek(0, os.SEEK_END)
+        vectors_file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+
+    def _read_row(self, fd: int, offset: int, row: int) -> np.ndarray:
+        """Read one float32 row from a file of rows starting at offset."""
+        row_bytes = self.dim * 4
+        return np.frombuffer(os.pread(fd, row_bytes, offset + row * row_bytes), dtype=np.float32)
+
+    def _read_vectors(self, ids: List[int]) -> np.ndarray:
+        """Read the float32 rows of the given entries."""
+        fd = self._vectors_file.fileno()
+        return np.stack([self._read_row(fd, 0, i) for i in ids])
+
+    def _read_snapshot(self, f) -> Tuple[List[Dict[str, Any]], bytes, int]:
+        """
+        Read a snapshot's entries and serialized index.
+
+        Args:
+            f: Snapshot file opened for binary reading
+
+        Returns:
+            Tuple[List[Dict[str, Any]], bytes, int]:
+                - Entries, one per row
+                - Serialized faiss index
+                - File offset of the first float32 row
+        """
+        magic, dim, entries_len, index_len, count = _SNAPSHOT_HEADER.unpack(
+            f.read(_SNAPSHOT_HEADER.size)
+        )
+        if magic != SNAPSHOT_MAGIC or dim != self.dim:
+            raise ValueError("Semantic cache snapshot has an incompatible format")
+        entries = json.loads(f.read(entries_len))
+        index_bytes = f.read(index_len)
+        offset = _SNAPSHOT_HEADER.size + entries_len + index_len
+        if len(entries) != count or os.fstat(f.fileno()).st_size != offset + count * dim * 4:
+            raise ValueError("Semantic cache snapshot is truncated")
+        return entries, index_bytes, offset
+
+    def _load(self) -> None:
+        """Load the persisted snapshot, or start empty."""
+        self.index = self._new_index()
+        self.entries: List[Dict[str, Any]] = []
+        self._vectors_file = self._new_vectors_file()
+        # Whether the quantizer was trained on cached vectors rather than bounds
+        self._trained = False
+        if not self.snapshot_path.exists():
+            return
+        try:
+            # Snapshots are replaced atomically, so an open file is always complete
+            with self.snapshot_path.open('rb') as f:
+                entries, index_bytes, offset = self._read_snapshot(f)
+                index = faiss.deserialize_index(np.frombuffer(index_bytes, dtype=np.uint8))
+                index.hnsw.efSearch = HNSW_EF_SEARCH
+                if index.ntotal != len(entries):
+                    raise ValueError("Semantic cache index and entries are out of sync")
+                vectors_file = self._new_vectors_file()
+                for start in range(0, len(entries), COPY_CHUNK_ROWS):
+                    rows = range(start, min(start + COPY_CHUNK_ROWS, len(entries)))
+                    self._append_vectors(
+                        vectors_file, np.stack([self._read_row(f.fileno(), offset, i) for i in rows])
+                    )
+            self._vectors_file.close()
+            self.index, self.entries, self._vectors_file = index, entries, vectors_file
+            # Snapshots of this many rows are always written with a trained quantizer
+            self._trained = len(entries) >= TRAIN_MIN_ROWS
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Failed to load semantic cache: {e}")
+
+    def _is_live(self, entry: Optional[Dict[str, Any]]) -> bool:
+        """Whether an entry is present and within its TTL."""
+        if entry is None:
+            return False
+        try:
+            return datetime.now() - datetime.fromisoformat(entry["response"]["timestamp"]) <= self.ttl
+        except (KeyError, ValueError):
+            return False
+
+    def _compact(self, keep: int) -> None:
+        """
+        Rebuild the index from the newest live entries.
+
+        HNSW cannot remove vectors, so expired and dropped slots are only
+        reclaimed by rebuilding; a rebuild also retrains the quantizer on the
+        cached vectors. A full rebuild takes seconds, so it runs
+        without the lock: lookups and inserts keep using the old index, and
+        entries added meanwhile are carried over when the new one is swapped in.
+
+        Args:
+            keep (int): Maximum number of entries to keep
+        """
+        try:
+            with self._lock:
+                count = len(self.entries)
+                live = [i for i, entry in enumerate(self.entries) if self._is_live(entry)]
+                live = live[len(live) - keep:] if len(live) > keep else live
+                entries = [self.entries[i] for i in live]
+                # Only a compaction closes the vectors file, and only one runs at a time
+                fd = self._vectors_file.fileno()
+
+            sample = self._training_sample(lambda i: self._read_row(fd, 0, live[i]), len(live))
+            index = self._new_index(sample)
+            vectors_file = self._new_vectors_file()
+            for start in range(0, len(live), COPY_CHUNK_ROWS):
+                vectors = np.stack([self._read_row(fd, 0, i) for i in live[start:start + COPY_CHUNK_ROWS]])
+                index.add(vectors)
+                self._append_vectors(vectors_file, vectors)
+
+            with self._lock:
+                added = list(range(count, len(self.entries)))
+                for start in range(0, len(added), COPY_CHUNK_ROWS):
+                    vectors = self._read_vectors(added[start:start + COPY_CHUNK_ROWS])
+                    index.add(vectors)
+                    self._append_vectors(vectors_file, vectors)
+                self._vectors_file.close()
+                self.index, self.entries, self._vectors_file = index, entries + self.entries[count:], vectors_file
+                self._trained = sample is not None
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Failed to compact semantic cache: {e}")
+        finally:
+            self._compacting = False
+
+    def _normalize(self, embedding) -> np.ndarray:
+        """Convert an embedding into a normalized float32 row vector."""
+        # normalize_L2 works in place, so never hand it the caller's array
+        vector = np.array(embedding, dtype=np.float32, copy=True).reshape(1, -1)
+        faiss.normalize_L2(vector)
+        return vector
+
+    def get(self, embedding, max_context: int) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Retrieve the cached response of the most similar prior query.
+
+        Args:
+            embedding: Embedding of the incoming query
+            max_context (int): Number of context messages the answer must be based on
+
+        Returns:
+            Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+                - Cached response or None if no sufficiently similar entry
+                - Current cache statistics
+        """
+        vector = self._normalize(embedding)
+        with self._lock:
+            if self.index.ntotal == 0:
+                self.stats["misses"] += 1
+                return None, self.stats
+            # Re-rank compatible quantized ANN candidates by exact similarity
+            _, ids = self.index.search(vector, RECHECK_CANDIDATES)
+            candidates = [
+                int(i) for i in ids[0]
+                if i >= 0 and self.entries[i] is not None
+                and self.entries[i]["prompt_hash"] == self.prompt_hash
+                and self.entries[i].get("max_context") == max_context
+            ]
+            scores = (self._read_vectors(candidates) @ vector[0]).tolist() if candidates else []
+            if not scores or max(scores) < self.threshold:
+                self.stats["misses"] += 1
+                return None, self.stats
+            entry_id = candidates[scores.index(max(scores))]
+            entry = self.entries[entry_id]
+
+            try:
+                response = entry["response"]
+                cached_time = datetime.fromisoformat(response['timestamp'])
+                if datetime.now() - cached_time > self.ttl:
+                    # HNSW does not support removal; drop the payload now and
+                    # reclaim the slot on the next compaction
+                    self.entries[entry_id] = None
+                    self.stats["expired"] += 1
+                    return None, self.stats
+            except (KeyError, ValueError):
+                self.stats["errors"] += 1
+                return None, self.stats
+
+        self.stats["hits"] += 1
+        return {**response, "cached": True}, self.stats
+
+    def set(self, query: str, embedding, response: Dict[str, Any], max_context: int) -> None:
+        """
+        Store a response keyed by its query embedding.
+
+        Args:
+            query (str): The original query
+            embedding: Embedding of the query
+            response (Dict[str, Any]): The response to cache
+            max_context (int): Number of context messages the answer was based on
+        """
+        vector = self._normalize(embedding)
+        with self._lock:
+            self.index.add(vector)
+            self._append_vectors(self._vectors_file, vector)
+            self.entries.append({
+                "query": query,
+                "prompt_hash": self.prompt_hash,
+                "max_context": max_context,
+                "response": response
+            })
+            # Also rebuild once a new cache has enough vectors to train on
+            full = len(self.entries) > self.max_entries
+            untrained = not self._trained and len(self.entries) >= TRAIN_MIN_ROWS
+            if (full or untrained) and not self._compacting:
+                self._compacting = True
+                threading.Thread(
+                    target=self._compact, args=(int(self.max_entries * COMPACT_RATIO),), daemon=True
+                ).start()
+
+    def _write_snapshot(
+        self,
+        rows: List[Tuple[int, int, int, Dict[str, Any]]],
+        index: Optional[faiss.Index] = None
+    ) -> None:
+        """
+        Atomically replace the snapshot with the given rows.
+
+        Args:
+            rows: (fd, offset, row, entry) tuples locating each entry's float32 vector
+            index: Index already holding exactly these rows in order; built from
+                the rows if None
+        """
+        def vectors(start: int) -> np.ndarray:
+            return np.stack([
+                self._read_row(fd, offset, row)
+                for fd, offset, row, _ in rows[start:start + COPY_CHUNK_ROWS]
+            ])
+
+        if index is None:
+            index = self._new_index(self._training_sample(lambda i: self._read_row(*rows[i][:3]), len(rows)))
+            for start in range(0, len(rows), COPY_CHUNK_ROWS):
+                index.add(vectors(start))
+        index_bytes = faiss.serialize_index(index).tobytes()
+        entries_bytes = json.dumps([entry for *_, entry in rows], ensure_ascii=False).encode('utf-8')
+
+        tmp_path = self.snapshot_path.with_suffix(".tmp")
+        with tmp_path.open('wb') as f:
+            f.write(_SNAPSHOT_HEADER.pack(
+                SNAPSHOT_MAGIC, self.dim, len(entries_bytes), len(index_bytes), len(rows)
+            ))
+            f.write(entries_bytes)
+            f.write(index_bytes)
+            for start in range(0, len(rows), COPY_CHUNK_ROWS):
+                f.write(vectors(start).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    def save(self) -> None:
+        """
+        Merge this process's entries into the persisted snapshot.
+
+        Every worker without Redis keeps a private cache and saves it on
+        shutdown. Saves are serialized with a file lock and merged with the
+        entries other workers already persisted, keeping the newest
+        max_entries, so one worker's save never discards another's. The index
+        is rebuilt at most once per save, and not at all when nothing was
+        merged or dropped.
+        """
+        with self._lock, self.lock_path.open('a') as lock_file:
+            snapshot = None
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                fd = self._vectors_file.fileno()
+                ours = [(fd, 0, i, entry) for i, entry in enumerate(self.entries) if self._is_live(entry)]
+                theirs = []
+
+                if self.snapshot_path.exists():
+                    try:
+                        snapshot = self.snapshot_path.open('rb')
+                        entries, _, offset = self._read_snapshot(snapshot)
+                        keys = {(e["prompt_hash"], e.get("max_context"), e["query"]) for *_, e in ours}
+                        theirs = [
+                            (snapshot.fileno(), offset, i, entry)
+                            for i, entry in enumerate(entries)
+                            if self._is_live(entry)
+                            and (entry["prompt_hash"], entry.get("max_context"), entry["query"]) not in keys
+                        ]
+                    except Exception as e:
+                        self.stats["errors"] += 1
+                        logger.warning(f"Ignoring unreadable semantic cache snapshot: {e}")
+
+                trained = self._trained or len(ours) < TRAIN_MIN_ROWS
+                if trained and not theirs and len(ours) == len(self.entries) <= self.max_entries:
+                    # Nothing merged or dropped, so the live index already matches
+                    # the rows; rebuilding HNSW is the slow part of a save
+                    self._write_snapshot(ours, self.index)
+                else:
+                    rows = sorted(ours + theirs, key=lambda row: row[3]["response"]["timestamp"])
+                    self._write_snapshot(rows[-self.max_entries:] if self.max_entries else [])
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.warning(f"Failed to persist semantic cache: {e}")
+            finally:
+                if snapshot is not None:
+                    snapshot.close()
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get current cache statistics.
+
+        Returns:
+            Dict[str, Any]: Cache statistics
+        """
+        return self.stats
+
+class RedisSemanticCache:
+    def __init__(
+        self,
+        prompt_hash: str,
+        redis_url: str,
+        ttl_hours: int = 24,
+        dim: int = 1536,
+        threshold: float = 0.95,
+        name: str = "rag_cache",
+        vector_type: str = "FLOAT16"
+    ):
+        """
+        Initialize a semantic cache backed by a RediSearch HNSW index.
+
+        Unlike SemanticCache, entries are shared by every worker pointing
+        at the same Redis instance.
+
+        Args:
+            prompt_hash (str): Hash of the prompt/model used to generate responses;
+                entries generated under a different prompt are never returned
+            redis_url (str): Redis connection URL
+            ttl_hours (int): Time-to-live in hours for cache entries
+            dim (int): Embedding dimension
+            threshold (float): Minimum cosine similarity for a cache hit
+            name (str): Base name of the search index and key prefix
+            vector_type (str): RediSearch vector type, "FLOAT16" or "FLOAT32"
+        """
+        self.prompt_hash = prompt_hash
+        self.ttl_seconds = int(timedelta(hours=ttl_hours).total_seconds())
+        self.dim = dim
+        self.max_distance = 1 - threshold
+        self.vector_type = vector_type
+        self.dtype = np.float16 if vector_type == "FLOAT16" else np.float32
+        # Keep indexes of different vector types and schemas apart so stored hashes always match
+        self.name = f"{name}_{vector_type.lower()}_v{REDIS_SCHEMA_VERSION}"
+        self.prefix = f"{self.name}:"
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "errors": 0
+        }
+        self.client = redis.Redis.from_url(
+            redis_url,
+            socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+            socket_timeout=REDIS_SOCKET_TIMEOUT
+        )
+        self._ensure_index()
+
+    def _ensure_index(self) -> None:
+        """Create the HNSW search index if it doesn't exist."""
+        try:
+            self.client.ft(self.name).info()
+        except redis.ResponseError:
+            self.client.ft(self.name).create_index(
+                [
+                    TagField("prompt_hash"),
+                    NumericField("max_context"),
+                    VectorField(
+                        "embedding",
+                        "HNSW",
+                        {"TYPE": self.vector_type, "DIM": self.dim, "DISTANCE_METRIC": "COSINE"}
+                    )
+                ],
+                definition=IndexDefinition(prefix=[self.prefix], index_type=IndexType.HASH)
+            )
+
+    def _to_bytes(self, embedding) -> bytes:
+        """Serialize an embedding for storage and KNN queries."""
+        return np.asarray(embedding, dtype=self.dtype).tobytes()
+
+    def get(self, embedding, max_context: int) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Retrieve the cached response of the most similar prior query.
+
+        Args:
+            embedding: Embedding of the incoming query
+            max_context (int): Number of context messages the answer must be based on
+
+        Returns:
+            Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+                - Cached response or None if no sufficiently similar entry
+                - Current cache statistics
+        """
+        query = (
+            Query(
+                f"(@prompt_hash:{{{self.prompt_hash}}} @max_context:[{max_context} {max_context}])"
+                "=>[KNN 1 @embedding $vec AS distance]"
+            )
+            .return_fields("response", "distance")
+            .sort_by("distance")
+            .dialect(2)
+        )
+        try:
+            docs = self.client.ft(self.name).search(
+                query, query_params={"vec": self._to_bytes(embedding)}
+            ).docs
+            if not docs or float(docs[0].distance) > self.max_distance:
+                self.stats["misses"] += 1
+                return None, self.stats
+            response = json.loads(docs[0].response)
+        except (redis.RedisError, json.JSONDecodeError, ValueError) as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Semantic cache lookup failed: {e}")
+            return None, self.stats
+
+        self.stats["hits"] += 1
+        response["cached"] = True
+        return response, self.stats
+
+    def set(self, query: str, embedding, response: Dict[str, Any], max_context: int) -> None:
+        """
+        Store a response keyed by its query embedding.
+
+        Args:
+            query (str): The original query
+            embedding: Embedding of the query
+            response (Dict[str, Any]): The response to cache
+            max_context (int): Number of context messages the answer was based on
+        """
+        key = f"{self.prefix}{uuid.uuid4().hex}"
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.hset(key, mapping={
+                "query": query,
+                "prompt_hash": self.prompt_hash,
+                "max_context": max_context,
+                "embedding": self._to_bytes(embedding),
+                "response": json.dumps(response, ensure_ascii=False)
+            })
+            pipe.expire(key, self.ttl_seconds)
+            pipe.execute()
+        except redis.RedisError as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Failed to cache response in Redis: {e}")
+
+    def save(self) -> None:
+        """No-op; Redis handles its own persistence."""
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get current cache statistics for this worker.
+
+        Returns:
+            Dict[str, Any]: Cache statistics
+        """
+        return self.stats
@@ -1,6 +1,7 @@
 import os
-import json
 from pathlib import Path
+
+import orjson
 from dotenv import load_dotenv
 
 def setup_credentials():
@@ -19,16 +20,29 @@ def setup_credentials():
     
     try:
         # Parse the JSON string to ensure it's valid
-        credentials_data = json.loads(credentials_json)
+        credentials_data = orjson.loads(credentials_json)
+        payload = orjson.dumps(credentials_data)
         
-        # Write credentials to file
         credentials_file = credentials_dir / "firebase-credentials.json"
-        with open(credentials_file, "w") as f:
-            json.dump(credentials_data, f, indent=2)
+        if credentials_file.exists() and credentials_file.read_bytes() == payload:
+            os.chmod(credentials_file, 0o600)
+            print(f"✅ Credentials in {credentials_file} are up to date")
+            return
+        
+        # Write to a private temp file and rename it into place, so a crash
+        # never leaves a truncated key file behind
+        tmp_file = credentials_file.with_suffix(".tmp")
+        fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_file, 0o600)  # In case the temp file already existed
+        os.replace(tmp_file, credentials_file)
             
         print(f"✅ Credentials written to {credentials_file}")
         
-    except json.JSONDecodeError:
+    except orjson.JSONDecodeError:
         raise ValueError("Invalid JSON in FIREBASE_CREDENTIALS environment variable")
     except Exception as e:
         raise Exception(f"Error writing credentials: {str(e)}")
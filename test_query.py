@@ -1,9 +1,13 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from langchain_openai import OpenAIEmbeddings
 from langchain_pinecone import PineconeVectorStore
 from datetime import datetime
 from dotenv import load_dotenv
 
+from query import get_pinecone_index
+
 # Load environment variables
 load_dotenv()
 
@@ -21,16 +25,18 @@ if not all([PINECONE_API_KEY, OPENAI_API_KEY]):
 
 # Initialize embeddings and vector store
 embeddings = OpenAIEmbeddings()
-vectorstore = PineconeVectorStore.from_existing_index(
-    index_name=index_name,
+vectorstore = PineconeVectorStore(
+    index=get_pinecone_index(index_name),
     embedding=embeddings,
     text_key="content"
 )
 
+# Serializes output so concurrent searches print whole blocks
+print_lock = threading.Lock()
+
 def search_messages(query, top_k=5):
     """Search for messages similar to the query."""
-    print(f"\nSearching for: '{query}'")
-    print("-" * 50)
+    lines = [f"\nSearching for: '{query}'", "-" * 50]
     
     # Search using similarity search
     results = vectorstore.similarity_search_with_score(
@@ -38,13 +44,13 @@ def search_messages(query, top_k=5):
         k=top_k
     )
     
-    # Print results
+    # Collect results
     for doc, score in results:
         metadata = doc.metadata
-        print(f"\nRelevance Score: {1 - score:.2f}")  # Convert distance to similarity score
+        lines.append(f"\nRelevance Score: {1 - score:.2f}")  # Convert distance to similarity score
         
         # Print all available metadata for debugging
-        print("Available metadata fields:", metadata.keys())
+        lines.append(f"Available metadata fields: {metadata.keys()}")
         
         # Access metadata fields safely with get()
         channel_id = metadata.get('channel_id', 'Unknown Channel')
@@ -60,11 +66,15 @@ def search_messages(query, top_k=5):
             except:
                 time_str = str(timestamp)
         
-        print(f"Channel: {channel_id}")
-        print(f"User: {user_name}")
-        print(f"Time: {time_str}")
-        print(f"Message: {message_content}")
-        print("-" * 50)
+        lines.append(f"Channel: {channel_id}")
+        lines.append(f"User: {user_name}")
+        lines.append(f"Time: {time_str}")
+        lines.append(f"Message: {message_content}")
+        lines.append("-" * 50)
+    
+    with print_lock:
+        print("\n".join(lines))
+        print("\n")
 
 def main():
     """Run some test queries."""
@@ -80,10 +90,9 @@ def main():
     print("Testing RAG System")
     print("=" * 50)
     
-    # Run test queries
-    for query in test_queries:
-        search_messages(query)
-        print("\n")
+    # Queries are independent, so run them concurrently
+    with ThreadPoolExecutor(max_workers=len(test_queries)) as executor:
+        list(executor.map(search_messages, test_queries))
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file